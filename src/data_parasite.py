@@ -8,14 +8,26 @@ Usage:
 """
 
 from __future__ import annotations
-import os, csv, json, time, argparse, logging, random
+import os, csv, json, time, argparse, logging, logging.handlers, random, string, itertools, asyncio, functools
+import atexit, queue, tempfile, email.utils, contextlib
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Optional, List, Dict, Any, Type
+from typing import Optional, List, Dict, Any, Type, Iterable, Iterator, AsyncIterator, Callable, Awaitable
 from pydantic import BaseModel, create_model
-from openai import OpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, APIConnectionError, APITimeoutError, APIStatusError
+from openai.types.responses import Response
+import httpx
 import yaml
-import pandas as pd
+
+try:
+    import orjson
+except ImportError:  # pinned in requirements.txt; stdlib json remains as a fallback
+    orjson = None
+
+try:
+    import h2  # noqa: F401  (httpx needs it for HTTP/2)
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
 
 # ============================================================================
 # INFRASTRUCTURE CONFIGURATION
@@ -34,6 +46,39 @@ PRICING = {
     'o4-mini-deep-research': dict(inp=2.00,  cache=0.50,  out=8.00,  search=10.00),
 }
 
+# Per-unit prices (per token, per search call) precomputed from PRICING
+_COST_VECTORS = {
+    m: (p['inp'] / 1_000_000, p['cache'] / 1_000_000, p['out'] / 1_000_000, p['search'] / 1000)
+    for m, p in PRICING.items()
+}
+
+# Models that accept the `reasoning` parameter
+REASONING_MODELS = frozenset({"gpt-5", "gpt-5-mini", "gpt-5.1", "gpt-5.2"})
+
+# Default in-flight API requests; requests are I/O-bound coroutines, so this is
+# a rate-limit budget rather than a function of CPU count (override with --max-workers)
+DEFAULT_MAX_WORKERS = 64
+
+# Transient API failures retried with exponential backoff + jitter (SDK retries are disabled).
+# 408/409/429 and 5xx are retried like the SDK does; a server-sent Retry-After wins over backoff.
+# Timeouts are not retried: a 600s request that timed out may still be billed server-side.
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 429})
+RETRY_ATTEMPTS = 4
+RETRY_BACKOFF_INITIAL = 1.0
+RETRY_BACKOFF_MAX = 30.0
+RETRY_AFTER_MAX = 60.0
+
+# OpenAI Batch API (--batch): per-batch request and input-file caps (API limits are
+# 50,000 requests / 200 MB; bytes kept under with headroom), status poll interval, token price factor
+BATCH_MAX_REQUESTS = 50_000
+BATCH_MAX_BYTES = 190 * 1024 * 1024
+BATCH_POLL_SECONDS = 30
+BATCH_TOKEN_DISCOUNT = 0.5
+BATCH_TERMINAL_STATES = frozenset({"completed", "failed", "expired", "cancelled"})
+
+# Records buffered in the JSONL writer before an explicit flush
+FLUSH_EVERY = 50
+
 TYPE_MAPPING = {
     'Optional[str]': Optional[str],
     'str': str,
@@ -57,19 +102,52 @@ class TaskConfig:
             data = yaml.safe_load(f)
         
         self.output_model = self._create_output_model(data.get('output_schema', {}))
+        self.output_field_names = tuple(self.output_model.model_fields.keys())
+        self._error_template = {k: "error" for k in self.output_field_names}
         self.csv_column_mapping = data.get('csv_column_mapping', {})
-        self.required_columns = data.get('required_columns', [])
+        self.required_columns = tuple(data.get('required_columns', []))
+        self._mapping_csv = tuple(self.csv_column_mapping.keys())
+        self._mapping_var = tuple(self.csv_column_mapping.values())
         self.prompt_system = data.get('prompt_system', '')
         self.prompt_user = data.get('prompt_user', '')
         self.default_model = data.get('default_model', 'gpt-4o-mini')
+        
+        # Parse the user prompt template once and fail fast on unknown placeholders
+        self.prompt_fields = self._parse_prompt_fields(self.prompt_user)
+        unknown = [f for f in self.prompt_fields if f not in self._mapping_var]
+        if unknown:
+            raise ValueError(f"prompt_user references unmapped variables: {unknown}")
+        self._render_user = self.prompt_user.format_map
+        self.system_msg = {"role": "system", "content": self.prompt_system}
+    
+    @functools.cached_property
+    def text_format(self) -> Dict[str, Any]:
+        """Structured-output format exactly as responses.parse sends it (Batch API bodies only)."""
+        # Private SDK helper, imported lazily so the default sync path never depends on it
+        from openai.lib._parsing._responses import type_to_text_format_param
+        return type_to_text_format_param(self.output_model)
+    
+    @staticmethod
+    def _parse_prompt_fields(template: str) -> List[str]:
+        """Return the distinct placeholder names used in a str.format template."""
+        fields = []
+        for _, field_name, _, _ in string.Formatter().parse(template):
+            if field_name is None:
+                continue
+            name = field_name.split('.', 1)[0].split('[', 1)[0]
+            if name not in fields:
+                fields.append(name)
+        return fields
     
     def _create_output_model(self, schema: Dict[str, Any]) -> Type[BaseModel]:
         """Dynamically create a Pydantic model from YAML schema definition."""
         fields = {}
+        self.field_tidiers: Dict[str, Callable[[Any], str]] = {}
         for field_name, field_spec in schema.items():
             field_type_str = field_spec.get('type', 'Optional[str]')
             field_type = TYPE_MAPPING.get(field_type_str, Optional[str])
             fields[field_name] = (field_type, None)
+            self.field_tidiers[field_name] = TIDIER_MAPPING.get(field_type_str, tidy_str)
         return create_model('OutputRecord', **fields)
 
 # ============================================================================
@@ -77,70 +155,133 @@ class TaskConfig:
 # ============================================================================
 
 def setup_logger(verbose: bool) -> logging.Logger:
-    logging.basicConfig(
-        level=logging.DEBUG if verbose else logging.INFO,
-        format="%(asctime)s %(levelname)s %(message)s"
-    )
+    """Route logging through a queue so stderr writes happen on a background thread."""
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    root = logging.getLogger()
+    root.setLevel(logging.DEBUG if verbose else logging.INFO)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener.start()
+    atexit.register(listener.stop)
     return logging.getLogger("data_parasite")
 
-def compute_cost(model: str, usage: Dict[str, int]) -> float:
-    p = PRICING.get(model, PRICING.get('gpt-4o-mini'))
-    non_cached = max(usage.get('input_tokens', 0) - usage.get('cached_tokens', 0), 0)
-    return (
-        (non_cached / 1_000_000) * p['inp'] +
-        (usage.get('cached_tokens', 0) / 1_000_000) * p['cache'] +
-        (usage.get('output_tokens', 0) / 1_000_000) * p['out'] +
-        (usage.get('web_search_calls', 0) / 1000) * p['search']
+def compute_cost(model: str, usage: Dict[str, int], batch: bool = False) -> float:
+    ci, cc, co, cs = _COST_VECTORS.get(model, _COST_VECTORS['gpt-4o-mini'])
+    it = usage.get('input_tokens', 0)
+    ct = usage.get('cached_tokens', 0)  # cached tokens are a subset of input tokens
+    tokens = (it - ct) * ci + ct * cc + usage.get('output_tokens', 0) * co
+    if batch:
+        tokens *= BATCH_TOKEN_DISCOUNT
+    return tokens + usage.get('web_search_calls', 0) * cs
+
+def make_http_client(max_concurrency: int) -> httpx.AsyncClient:
+    """SDK-default async client (600s timeouts, redirects) with HTTP/2 and a pool sized to the concurrency."""
+    return DefaultAsyncHttpxClient(
+        http2=HTTP2,
+        limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
     )
 
-def ensure_paths(out_path: Path) -> Path:
+def ensure_paths(out_path: Path) -> tuple[Path, Path]:
+    """Create the output dir and an empty temp file; returns (tmp_path, final_path)."""
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_path.write_text("")  # truncate/create
-    return out_path
-
-def append_jsonl(path: Path, obj: Dict[str, Any]) -> None:
-    with path.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(obj, ensure_ascii=False) + "\n")
-
-def tidy(value: Optional[str]) -> str:
+    tmp_path = out_path.with_name(out_path.name + ".tmp")
+    tmp_path.write_text("")  # truncate/create
+    return tmp_path, out_path
+
+def finalize_output(tmp_path: Path, final_path: Path) -> None:
+    """Atomically move a completed temp file into place and persist the rename."""
+    os.replace(tmp_path, final_path)
+    if os.name == "posix":
+        fd = os.open(final_path.parent, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+def cached_timestamp() -> Callable[[], str]:
+    """Return a clock giving local time as ISO seconds, formatted at most once per second."""
+    last_sec, text = -1, ""
+
+    def now() -> str:
+        nonlocal last_sec, text
+        sec = int(time.time())
+        if sec != last_sec:
+            last_sec, text = sec, time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(sec))
+        return text
+
+    return now
+
+def jsonl_line(obj: Dict[str, Any]) -> bytes:
+    """Serialize one record as a UTF-8 encoded JSONL line."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(obj, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+def tidy_str(value: Optional[str]) -> str:
     """Convert None or empty strings to 'not_found'."""
-    if value is None:
-        return "not_found"
-    if isinstance(value, bool):
-        return str(value).lower()
-    if isinstance(value, (int, float)):
-        return str(value)
     return value if (value and value.strip()) else "not_found"
 
+def tidy_number(value: Optional[float]) -> str:
+    """Convert None to 'not_found' and numbers to their string form."""
+    return "not_found" if value is None else str(value)
+
+def tidy_bool(value: Optional[bool]) -> str:
+    """Convert None to 'not_found' and booleans to 'true'/'false'."""
+    return "not_found" if value is None else ("true" if value else "false")
+
+# Output field type -> tidier, resolved once per field at config load
+TIDIER_MAPPING = {
+    'Optional[str]': tidy_str,
+    'str': tidy_str,
+    'Optional[int]': tidy_number,
+    'int': tidy_number,
+    'Optional[float]': tidy_number,
+    'float': tidy_number,
+    'Optional[bool]': tidy_bool,
+    'bool': tidy_bool,
+}
+
 def extract_tool_usage(response) -> dict:
     """Extract accurate web_search usage counts."""
     tool_usage = {'web_search_calls': 0}
     try:
-        if hasattr(response, 'output') and response.output:
+        output = getattr(response, "output", None)
+        if output:
             search_count = 0
-            for item in response.output:
-                if getattr(item, "type", None) == "web_search_call":
-                    action = getattr(item, "action", None)
-                    if action is not None and getattr(action, "type", None) == "search":
+            for item in output:
+                try:
+                    if item.type == "web_search_call" and item.action.type == "search":
                         search_count += 1
+                except AttributeError:  # item without a type, or a call without an action
+                    continue
             tool_usage['web_search_calls'] = search_count
     except Exception as e:
         logging.getLogger("data_parasite").warning("Could not extract tool usage: %s", e)
     return tool_usage
 
-def parse_row_data(row: Dict[str, str], mapping: Dict[str, str]) -> Dict[str, str]:
+def parse_row_data(row: Dict[str, str], config: TaskConfig) -> Dict[str, str]:
     """Extract and map CSV columns to prompt variables."""
-    data = {}
-    for csv_col, var_name in mapping.items():
-        data[var_name] = (row.get(csv_col) or "").strip()
-    return data
+    return {v: (row.get(c) or "").strip() for c, v in zip(config._mapping_csv, config._mapping_var)}
 
 # ============================================================================
 # API INTERACTION
 # ============================================================================
 
-def call_model(
-    client: OpenAI,
+@functools.lru_cache(maxsize=None)
+def base_params(model: str, search_context_size: str, reasoning_effort: str) -> Dict[str, Any]:
+    """Request parameters shared by every call of a run (treat as read-only)."""
+    params = {
+        "model": model,
+        "tools": [{"type": "web_search", "search_context_size": search_context_size}],
+    }
+    if model in REASONING_MODELS:
+        params["reasoning"] = {"effort": reasoning_effort}
+    return params
+
+async def call_model(
+    client: AsyncOpenAI,
     model: str,
     config: TaskConfig,
     prompt_vars: Dict[str, str],
@@ -148,29 +289,33 @@ def call_model(
     search_context_size: str,
 ) -> Dict[str, Any]:
     """Generic API call with web search and structured output."""
+    # Constant system message first keeps the prompt prefix stable for OpenAI prompt caching
     params = {
-        "model": model,
-        "input": [
-            {"role": "system", "content": config.prompt_system},
-            {"role": "user", "content": config.prompt_user.format(**prompt_vars)}
-        ],
-        "tools": [{"type": "web_search", "search_context_size": search_context_size}],
+        **base_params(model, search_context_size, reasoning_effort),
+        "input": [config.system_msg, {"role": "user", "content": config._render_user(prompt_vars)}],
     }
-    if model in {"gpt-5", "gpt-5-mini", "gpt-5.1", "gpt-5.2"}:
-        params["reasoning"] = {"effort": reasoning_effort}
 
-    resp = client.responses.parse(text_format=config.output_model, **params)
+    resp = await client.responses.parse(text_format=config.output_model, **params)
+    return summarize_response(resp, getattr(resp, "output_parsed", None))
 
-    usage_obj = getattr(resp, "usage", None)
-    usage = {
-        "input_tokens": getattr(usage_obj, "input_tokens", 0) or 0,
-        "output_tokens": getattr(usage_obj, "output_tokens", 0) or 0,
-        "total_tokens": getattr(usage_obj, "total_tokens", 0) or 0,
-        "cached_tokens": getattr(getattr(usage_obj, "input_tokens_details", None), "cached_tokens", 0) or 0,
-    }
+def summarize_response(resp: Response, parsed: Optional[BaseModel]) -> Dict[str, Any]:
+    """Collect status, usage and the parsed payload from a Responses API result."""
+    # Usage attributes are present on normal responses; AttributeError covers a missing usage block
+    u = getattr(resp, "usage", None)
+    try:
+        usage = {
+            "input_tokens": u.input_tokens or 0,
+            "output_tokens": u.output_tokens or 0,
+            "total_tokens": u.total_tokens or 0,
+        }
+    except AttributeError:
+        usage = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+    try:
+        usage["cached_tokens"] = u.input_tokens_details.cached_tokens or 0
+    except AttributeError:
+        usage["cached_tokens"] = 0
     usage.update(extract_tool_usage(resp))
 
-    parsed = getattr(resp, "output_parsed", None)
     ok = getattr(resp, "status", "completed") == "completed" and parsed is not None
 
     return {
@@ -181,13 +326,98 @@ def call_model(
         "error": None if ok else "incomplete or no parsed payload"
     }
 
+def _is_retryable(e: Exception) -> bool:
+    """Whether an API error is transient and worth resending."""
+    if isinstance(e, APITimeoutError):
+        return False
+    if isinstance(e, APIStatusError):
+        return e.status_code in RETRYABLE_STATUS_CODES or e.status_code >= 500
+    return isinstance(e, APIConnectionError)
+
+def _retry_after(e: Exception) -> Optional[float]:
+    """Seconds the server asked us to wait (retry-after-ms / retry-after), if sane."""
+    if not isinstance(e, APIStatusError):
+        return None
+    retry_ms = e.response.headers.get("retry-after-ms")
+    retry = e.response.headers.get("retry-after")
+    delay = None
+    try:
+        if retry_ms:
+            delay = float(retry_ms) / 1000
+        elif retry:
+            delay = float(retry)
+    except ValueError:
+        pass
+    if delay is None and retry:
+        try:  # HTTP-date form
+            delay = email.utils.parsedate_to_datetime(retry).timestamp() - time.time()
+        except (TypeError, ValueError):
+            pass
+    return delay if delay is not None and 0 < delay <= RETRY_AFTER_MAX else None
+
+async def call_model_with_retry(
+    client: AsyncOpenAI,
+    model: str,
+    config: TaskConfig,
+    prompt_vars: Dict[str, str],
+    reasoning_effort: str,
+    search_context_size: str,
+) -> Dict[str, Any]:
+    """call_model with retries on rate limits, connection errors and 408/409/5xx responses."""
+    for attempt in range(1, RETRY_ATTEMPTS + 1):
+        try:
+            return await call_model(client, model, config, prompt_vars, reasoning_effort, search_context_size)
+        except (APIConnectionError, APIStatusError) as e:
+            if attempt == RETRY_ATTEMPTS or not _is_retryable(e):
+                raise
+            delay = _retry_after(e)
+            if delay is None:
+                delay = min(RETRY_BACKOFF_INITIAL * 2 ** (attempt - 1) + random.uniform(0, 1), RETRY_BACKOFF_MAX)
+            logging.getLogger("data_parasite").debug(
+                "Retrying in %.1fs (attempt %d/%d): %s", delay, attempt, RETRY_ATTEMPTS, e
+            )
+            await asyncio.sleep(delay)
+
+def build_batch_request(
+    custom_id: str,
+    model: str,
+    config: TaskConfig,
+    prompt_vars: Dict[str, str],
+    reasoning_effort: str,
+    search_context_size: str,
+) -> Dict[str, Any]:
+    """One Batch API input line carrying the same request call_model would send."""
+    body = {
+        **base_params(model, search_context_size, reasoning_effort),
+        "input": [config.system_msg, {"role": "user", "content": config._render_user(prompt_vars)}],
+        "text": {"format": config.text_format},
+    }
+    return {"custom_id": custom_id, "method": "POST", "url": "/v1/responses", "body": body}
+
+def parse_batch_item(item: Dict[str, Any], config: TaskConfig) -> Dict[str, Any]:
+    """Turn one Batch API output/error line into the dict call_model returns."""
+    response = item.get("response") or {}
+    body = response.get("body")
+    if item.get("error") or response.get("status_code") != 200 or not body:
+        error = item.get("error") or (body or {}).get("error") or f"HTTP {response.get('status_code')}"
+        if isinstance(error, dict):
+            error = error.get("message") or error
+        return {"success": False, "response_id": "N/A", "parsed": None, "usage": _empty_usage(), "error": str(error)}
+
+    resp = Response.model_validate(body)
+    try:
+        parsed = config.output_model.model_validate_json(resp.output_text)
+    except ValueError:
+        parsed = None
+    return summarize_response(resp, parsed)
+
 # ============================================================================
 # WORKER
 # ============================================================================
 
 def _build_error_result(config: TaskConfig, prompt_vars: Dict[str, str]) -> Dict[str, str]:
     """Build a result dict with error values for all output fields plus inputs."""
-    result = {k: "error" for k in config.output_model.model_fields.keys()}
+    result = config._error_template.copy()
     result.update({f"input_{k}": v for k, v in prompt_vars.items()})
     return result
 
@@ -195,8 +425,63 @@ def _empty_usage() -> Dict[str, int]:
     """Return empty usage dict."""
     return {"input_tokens": 0, "output_tokens": 0, "cached_tokens": 0, "web_search_calls": 0}
 
-def run_one(
-    client: OpenAI,
+def _missing_required(row: Dict[str, str], config: TaskConfig) -> List[str]:
+    """Return the required CSV columns that are empty in this row."""
+    if any(not (row.get(k) or "").strip() for k in config.required_columns):
+        return [k for k in config.required_columns if not (row.get(k) or "").strip()]
+    return []
+
+def _failed_output(
+    config: TaskConfig,
+    prompt_vars: Dict[str, str],
+    error: str,
+    duration: float,
+    usage: Optional[Dict[str, int]] = None,
+    response_id: str = "N/A",
+) -> Dict[str, Any]:
+    """Worker output for a row that produced no usable result."""
+    return {
+        "ok": False,
+        "prompt_vars": prompt_vars,
+        "result": _build_error_result(config, prompt_vars),
+        "usage": usage or _empty_usage(),
+        "response_id": response_id,
+        "duration": duration,
+        "cost": 0.0,
+        "error": error
+    }
+
+def _finish_output(
+    config: TaskConfig,
+    model: str,
+    prompt_vars: Dict[str, str],
+    res: Dict[str, Any],
+    duration: float,
+    batch: bool = False,
+) -> Dict[str, Any]:
+    """Worker output for a row from the dict returned by call_model / parse_batch_item."""
+    usage = res["usage"]
+    if not res["success"]:
+        return _failed_output(config, prompt_vars, res["error"], duration, usage, res["response_id"])
+
+    parsed = res["parsed"]
+    # Schema fields are plain scalars, so attribute reads match model_dump() without its overhead
+    result = {k: tidy(getattr(parsed, k)) for k, tidy in config.field_tidiers.items()}
+    result.update({f"input_{k}": v for k, v in prompt_vars.items()})
+    
+    return {
+        "ok": True,
+        "prompt_vars": prompt_vars,
+        "result": result,
+        "usage": usage,
+        "response_id": res["response_id"],
+        "duration": duration,
+        "cost": compute_cost(model, usage, batch=batch),
+        "error": None
+    }
+
+async def run_one(
+    client: AsyncOpenAI,
     model: str,
     config: TaskConfig,
     row: Dict[str, str],
@@ -204,75 +489,320 @@ def run_one(
     search_context_size: str,
 ) -> Dict[str, Any]:
     """Process one entity from the CSV."""
-    prompt_vars = parse_row_data(row, config.csv_column_mapping)
-    start = time.time()
+    prompt_vars = parse_row_data(row, config)
+    start = time.monotonic()
     
     # Check required fields
-    missing = [k for k in config.required_columns if not row.get(k, "").strip()]
+    missing = _missing_required(row, config)
     if missing:
-        return {
-            "ok": False,
-            "prompt_vars": prompt_vars,
-            "result": _build_error_result(config, prompt_vars),
-            "usage": _empty_usage(),
-            "response_id": "N/A",
-            "duration": time.time() - start,
-            "cost": 0.0,
-            "error": f"Missing required fields: {missing}"
-        }
+        return _failed_output(config, prompt_vars, f"Missing required fields: {missing}", time.monotonic() - start)
 
     try:
-        res = call_model(client, model, config, prompt_vars, reasoning_effort, search_context_size)
-        usage = res["usage"]
-        cost = compute_cost(model, usage)
-        duration = time.time() - start
-
-        if res["success"]:
-            parsed = res["parsed"]
-            result = {k: tidy(v) for k, v in parsed.model_dump().items()}
-            result.update({f"input_{k}": v for k, v in prompt_vars.items()})
-            
-            return {
-                "ok": True,
-                "prompt_vars": prompt_vars,
-                "result": result,
-                "usage": usage,
-                "response_id": res["response_id"],
-                "duration": duration,
-                "cost": cost,
-                "error": None
-            }
-        else:
-            return {
-                "ok": False,
-                "prompt_vars": prompt_vars,
-                "result": _build_error_result(config, prompt_vars),
-                "usage": usage,
-                "response_id": res["response_id"],
-                "duration": duration,
-                "cost": 0.0,
-                "error": res["error"]
-            }
-
+        res = await call_model_with_retry(client, model, config, prompt_vars, reasoning_effort, search_context_size)
+        return _finish_output(config, model, prompt_vars, res, time.monotonic() - start)
     except Exception as e:
-        return {
-            "ok": False,
-            "prompt_vars": prompt_vars,
-            "result": _build_error_result(config, prompt_vars),
-            "usage": _empty_usage(),
-            "response_id": "N/A",
-            "duration": time.time() - start,
-            "cost": 0.0,
-            "error": str(e)
-        }
+        return _failed_output(config, prompt_vars, str(e), time.monotonic() - start)
+
+# ============================================================================
+# BATCH API
+# ============================================================================
+
+async def _submit_batch(client: AsyncOpenAI, input_path: Path) -> str:
+    """Upload a Batch API input file and start a batch over it; returns the batch id."""
+    uploaded = await client.files.create(file=input_path, purpose="batch")
+    batch = await client.batches.create(
+        input_file_id=uploaded.id, endpoint="/v1/responses", completion_window="24h"
+    )
+    logging.getLogger("data_parasite").info("Submitted batch %s (%s)", batch.id, input_path.name)
+    return batch.id
+
+async def _wait_for_batch(client: AsyncOpenAI, batch_id: str):
+    """Poll a batch until it reaches a terminal state."""
+    log = logging.getLogger("data_parasite")
+    while True:
+        batch = await client.batches.retrieve(batch_id)
+        if batch.status in BATCH_TERMINAL_STATES:
+            log.info("Batch %s %s", batch_id, batch.status)
+            if batch.errors and batch.errors.data:
+                log.warning("Batch %s errors: %s", batch_id, [e.message for e in batch.errors.data])
+            return batch
+        counts = batch.request_counts
+        log.info("Batch %s %s: %d/%d done", batch_id, batch.status,
+                 (counts.completed + counts.failed) if counts else 0, counts.total if counts else 0)
+        await asyncio.sleep(BATCH_POLL_SECONDS)
+
+async def _cancel_batches(client: AsyncOpenAI, batch_ids: List[str]) -> None:
+    """Best-effort cancel of unfinished batches, logging any that need manual cleanup."""
+    log = logging.getLogger("data_parasite")
+    for batch_id in batch_ids:
+        try:
+            await client.batches.cancel(batch_id)
+            log.warning("Cancelled batch %s", batch_id)
+        except Exception as e:
+            log.error("Could not cancel batch %s; cancel it from the OpenAI dashboard: %s", batch_id, e)
+
+async def iter_batch_results(
+    client: AsyncOpenAI,
+    model: str,
+    config: TaskConfig,
+    rows: Iterable[Dict[str, str]],
+    reasoning_effort: str,
+    search_context_size: str,
+    dedupe: bool,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Run rows through the OpenAI Batch API, yielding run_one-style outputs.
+
+    Rows failing the required-column check are yielded right away; the rest
+    once their batch finishes. Input is split into batches of at most
+    BATCH_MAX_REQUESTS requests and BATCH_MAX_BYTES; if the run fails or is
+    interrupted, batches that have not finished are cancelled.
+    """
+    # Batch bookkeeping calls get the SDK's retries back; they run for hours
+    client = client.with_options(max_retries=RETRY_ATTEMPTS)
+    pending: Dict[str, list] = {}  # custom_id -> [prompt_vars, rows answered]
+    by_key: Dict[tuple, str] = {}
+    batch_ids: List[str] = []
+    finished = set()
+
+    try:
+        with tempfile.TemporaryDirectory(prefix="data_parasite_batch_") as tmp_dir:
+            chunk_path, chunk_f, chunk_count, chunk_bytes = None, None, 0, 0
+            try:
+                for row in rows:
+                    prompt_vars = parse_row_data(row, config)
+                    missing = _missing_required(row, config)
+                    if missing:
+                        yield _failed_output(config, prompt_vars, f"Missing required fields: {missing}", 0.0)
+                        continue
+                    if dedupe:
+                        key = dedupe_key(row, config)
+                        if key in by_key:
+                            pending[by_key[key]][1] += 1
+                            continue
+                    custom_id = f"row-{len(pending)}"
+                    if dedupe:
+                        by_key[key] = custom_id
+                    pending[custom_id] = [prompt_vars, 1]
+
+                    line = jsonl_line(build_batch_request(
+                        custom_id, model, config, prompt_vars, reasoning_effort, search_context_size
+                    ))
+                    # Cut a new input file at the request cap or before it would pass the size cap
+                    if chunk_f is not None and (
+                        chunk_count == BATCH_MAX_REQUESTS or chunk_bytes + len(line) > BATCH_MAX_BYTES
+                    ):
+                        chunk_f.close()
+                        chunk_f = None
+                        batch_ids.append(await _submit_batch(client, chunk_path))
+                    if chunk_f is None:
+                        chunk_path = Path(tmp_dir) / f"batch_input_{len(batch_ids)}.jsonl"
+                        chunk_f = chunk_path.open("wb")
+                        chunk_count, chunk_bytes = 0, 0
+                    chunk_f.write(line)
+                    chunk_count += 1
+                    chunk_bytes += len(line)
+                if chunk_f is not None:
+                    chunk_f.close()
+                    chunk_f = None
+                    batch_ids.append(await _submit_batch(client, chunk_path))
+            finally:
+                if chunk_f is not None:
+                    chunk_f.close()
+
+        for batch_id in batch_ids:
+            batch = await _wait_for_batch(client, batch_id)
+            finished.add(batch_id)
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if not file_id:
+                    continue
+                # Stream the result file line by line; it can be hundreds of MB per batch
+                async with client.files.with_streaming_response.content(file_id) as content:
+                    async for line in content.iter_lines():
+                        if not line.strip():
+                            continue
+                        item = json.loads(line)
+                        entry = pending.pop(item.get("custom_id"), None)
+                        if entry is None:
+                            continue
+                        prompt_vars, copies = entry
+                        # The Batch API gives no per-request timing, so batch rows record 0.0
+                        try:
+                            out = _finish_output(config, model, prompt_vars, parse_batch_item(item, config), 0.0, batch=True)
+                        except Exception as e:
+                            out = _failed_output(config, prompt_vars, str(e), 0.0)
+                        yield out
+                        # Deduplicated repeats share the answer at no extra cost
+                        for _ in range(copies - 1):
+                            yield {**out, "usage": _empty_usage(), "cost": 0.0, "duration": 0.0}
+    except BaseException:
+        # Failed upload, API error, Ctrl-C: don't leave submitted batches running (and billing) unattended
+        await _cancel_batches(client, [b for b in batch_ids if b not in finished])
+        raise
+
+    # Requests that never came back (batch failed, expired or was cancelled)
+    for prompt_vars, copies in pending.values():
+        for _ in range(copies):
+            yield _failed_output(config, prompt_vars, "No result returned by the Batch API", 0.0)
 
 # ============================================================================
 # MAIN PIPELINE
 # ============================================================================
 
-def load_rows(csv_path: Path) -> List[Dict[str, str]]:
+def load_rows(csv_path: Path) -> Iterator[Dict[str, str]]:
+    """Stream rows from the input CSV without materializing the whole file."""
+    with csv_path.open("r", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
+
+def count_rows(csv_path: Path) -> int:
+    """Count data rows without building dicts (blank lines are skipped, as DictReader does)."""
     with csv_path.open("r", encoding="utf-8") as f:
-        return list(csv.DictReader(f))
+        return max(sum(1 for r in csv.reader(f) if r) - 1, 0)
+
+def reservoir_sample(rows: Iterable[Dict[str, str]], k: int) -> List[Dict[str, str]]:
+    """Uniformly sample k rows from a stream in O(k) memory (Algorithm R)."""
+    sample = []
+    for i, row in enumerate(rows):
+        if i < k:
+            sample.append(row)
+        else:
+            j = random.randint(0, i)
+            if j < k:
+                sample[j] = row
+    return sample
+
+def dedupe_key(row: Dict[str, str], config: TaskConfig) -> tuple:
+    """Rows with equal keys send identical requests (and pass/fail the required check alike)."""
+    return (
+        tuple(parse_row_data(row, config).values()),
+        tuple(bool((row.get(k) or "").strip()) for k in config.required_columns),
+    )
+
+def deduped(
+    fn: Callable[[Dict[str, str]], Awaitable[Dict[str, Any]]],
+    config: TaskConfig,
+) -> Callable[[Dict[str, str]], Awaitable[Dict[str, Any]]]:
+    """Wrap fn so rows with identical prompt inputs share a single API call.
+
+    Repeats reuse the first row's result with zeroed usage/cost, since they cost nothing.
+    """
+    cache: Dict[tuple, asyncio.Future] = {}
+
+    async def run(row: Dict[str, str]) -> Dict[str, Any]:
+        key = dedupe_key(row, config)
+        task = cache.get(key)
+        if task is None:
+            task = cache[key] = asyncio.ensure_future(fn(row))
+            return await task
+        out = await task
+        return {**out, "usage": _empty_usage(), "cost": 0.0, "duration": 0.0}
+
+    return run
+
+async def iter_completed(
+    fn: Callable[[Dict[str, str]], Awaitable[Dict[str, Any]]],
+    rows: Iterable[Dict[str, str]],
+    max_inflight: int,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Yield fn(row) results as they finish, keeping at most max_inflight tasks running."""
+    rows = iter(rows)
+    inflight = {asyncio.ensure_future(fn(r)) for r in itertools.islice(rows, max_inflight)}
+    while inflight:
+        done, inflight = await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+        inflight.update(asyncio.ensure_future(fn(r)) for r in itertools.islice(rows, len(done)))
+        for task in done:
+            yield task.result()
+
+async def _driver(
+    api_key: str,
+    model: str,
+    config: TaskConfig,
+    rows: Iterable[Dict[str, str]],
+    n: int,
+    out_jsonl: Path,
+    csv_path: Optional[Path],
+    args: argparse.Namespace,
+    log: logging.Logger,
+) -> tuple[int, int, float]:
+    """Run all rows through the API and write results; returns (processed, ok, cost)."""
+    total_cost = 0.0
+    ok_count = 0
+    i = 0
+    timestamp = cached_timestamp()
+
+    # Cleaned CSV (inputs + outputs only) is written alongside the JSONL
+    input_cols = [f"input_{v}" for v in config._mapping_var]
+    output_cols = list(config.output_field_names)
+
+    # Process entities concurrently; one buffered handle per output for the whole run
+    out_f = out_jsonl.open("ab", buffering=1 << 20)
+    csv_f = csv_path.open("w", encoding="utf-8", newline="") if csv_path else None
+    files = [f for f in (out_f, csv_f) if f is not None]
+    try:
+        csv_writer = None
+        if csv_f is not None:
+            csv_writer = csv.DictWriter(csv_f, fieldnames=input_cols + output_cols, extrasaction='ignore')
+            csv_writer.writeheader()
+        async with AsyncOpenAI(
+            api_key=api_key, http_client=make_http_client(args.max_workers), max_retries=0
+        ) as client:
+            if args.batch:
+                results = iter_batch_results(
+                    client, model, config, rows, args.reasoning_effort, args.search_context_size, args.dedupe
+                )
+            else:
+                work = lambda r: run_one(client, model, config, r, args.reasoning_effort, args.search_context_size)
+                if args.dedupe:
+                    work = deduped(work, config)
+                results = iter_completed(work, rows, args.max_workers)
+            
+            # aclosing: finalize the generator (e.g. cancel pending batches) while the client is still open
+            async with contextlib.aclosing(results) as results_iter:
+                async for out in results_iter:
+                    i += 1
+
+                    # Build consolidated record: results + telemetry
+                    record = out["result"].copy()
+                    record.update({
+                        'timestamp': timestamp(),
+                        'model': model,
+                        'response_id': out["response_id"],
+                        'input_tokens': out["usage"].get("input_tokens", 0),
+                        'output_tokens': out["usage"].get("output_tokens", 0),
+                        'cached_tokens': out["usage"].get("cached_tokens", 0),
+                        'web_search_calls': out["usage"].get("web_search_calls", 0),
+                        'total_cost': round(out["cost"], 6),
+                        'duration_seconds': round(out["duration"], 2),
+                        'status': 'success' if out["ok"] else 'failed',
+                    })
+                
+                    if not out["ok"] and out.get("error"):
+                        record['error'] = out["error"]
+                
+                    out_f.write(jsonl_line(record))
+                    if csv_writer is not None:
+                        csv_writer.writerow(record)
+                    if i % FLUSH_EVERY == 0:
+                        for f in files:
+                            f.flush()
+
+                    if out["ok"]:
+                        ok_count += 1
+                        total_cost += out["cost"]
+                    else:
+                        log.debug("Failed: %s", out.get("error"))
+
+                    if i % 10 == 0 or i == n:
+                        log.info("Progress: %d/%d | cost=$%.4f", i, n, total_cost)
+
+        # Only a fully processed run is made durable and later moved into place
+        for f in files:
+            f.flush()
+            os.fsync(f.fileno())
+    finally:
+        for f in files:
+            f.close()
+
+    return i, ok_count, total_cost
 
 def main():
     ap = argparse.ArgumentParser(
@@ -292,7 +822,14 @@ Example:
     ap.add_argument("--reasoning-effort", choices=["low","medium","high"], default="medium",
                     help="Only for gpt-5* models; ignored otherwise")
     ap.add_argument("--search-context-size", choices=["low","medium","high"], default="medium")
-    ap.add_argument("--max-workers", type=int, default=min(32, (os.cpu_count() or 4)))
+    ap.add_argument("--max-workers", type=int, default=DEFAULT_MAX_WORKERS,
+                    help=f"Maximum concurrent API requests (default {DEFAULT_MAX_WORKERS})")
+    ap.add_argument("--no-csv", action="store_true",
+                    help="Skip writing the cleaned CSV next to the JSONL output")
+    ap.add_argument("--dedupe", action="store_true",
+                    help="Call the API once per distinct set of prompt inputs and reuse the result for repeats")
+    ap.add_argument("--batch", action="store_true",
+                    help="Submit through the OpenAI Batch API (cheaper, results within 24h) and wait for completion")
     ap.add_argument("-v","--verbose", action="store_true")
     args = ap.parse_args()
 
@@ -317,83 +854,45 @@ Example:
     if not src.exists():
         ap.error(f"CSV not found: {src}")
 
-    out_jsonl = ensure_paths(Path(args.output_file))
+    if args.max_workers < 1:
+        ap.error("--max-workers must be >= 1")
 
-    # Setup API client
+    # Outputs are written to *.tmp files and renamed into place once the run completes
+    out_jsonl_tmp, out_jsonl = ensure_paths(Path(args.output_file))
+    csv_tmp, csv_path = (None, None) if args.no_csv else ensure_paths(out_jsonl.with_suffix('.csv'))
+
+    # API key; the async client itself is created inside the event loop
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         ap.error("OPENAI_API_KEY is not set")
-    client = OpenAI(api_key=api_key)
 
-    # Load and optionally sample data
+    # Stream rows; sampling keeps only the reservoir in memory
     rows = load_rows(src)
-    if args.sample and args.sample < len(rows):
+    if args.sample:
         if args.seed is not None:
             random.seed(args.seed)
-        rows = random.sample(rows, args.sample)
-        log.info("Sampled %d rows", args.sample)
-
-    n = len(rows)
-    log.info("Processing %d entities with %d workers on model %s", n, args.max_workers, model)
+        rows = reservoir_sample(rows, args.sample)
+        n = len(rows)
+        log.info("Sampled %d rows", n)
+    else:
+        n = count_rows(src)
 
-    total_cost = 0.0
-    ok_count = 0
-    start_all = time.time()
-
-    # Process entities in parallel
-    with ThreadPoolExecutor(max_workers=args.max_workers) as ex:
-        futures = [
-            ex.submit(run_one, client, model, config, r, args.reasoning_effort, args.search_context_size) 
-            for r in rows
-        ]
-        
-        for i, fut in enumerate(as_completed(futures), 1):
-            out = fut.result()
-
-            # Build consolidated record: results + telemetry
-            record = out["result"].copy()
-            record.update({
-                'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
-                'model': model,
-                'response_id': out["response_id"],
-                'input_tokens': out["usage"].get("input_tokens", 0),
-                'output_tokens': out["usage"].get("output_tokens", 0),
-                'cached_tokens': out["usage"].get("cached_tokens", 0),
-                'web_search_calls': out["usage"].get("web_search_calls", 0),
-                'total_cost': round(out["cost"], 6),
-                'duration_seconds': round(out["duration"], 2),
-                'status': 'success' if out["ok"] else 'failed',
-            })
-            
-            if not out["ok"] and out.get("error"):
-                record['error'] = out["error"]
-            
-            append_jsonl(out_jsonl, record)
+    log.info("Processing %d entities with up to %d concurrent requests on model %s", n, args.max_workers, model)
 
-            if out["ok"]:
-                ok_count += 1
-                total_cost += out["cost"]
-            else:
-                log.debug("Failed: %s", out.get("error"))
-
-            if i % 10 == 0 or i == n:
-                log.info("Progress: %d/%d | cost=$%.4f", i, n, total_cost)
-
-    dur = time.time() - start_all
+    start_all = time.monotonic()
+    n, ok_count, total_cost = asyncio.run(
+        _driver(api_key, model, config, rows, n, out_jsonl_tmp, csv_tmp, args, log)
+    )
+    finalize_output(out_jsonl_tmp, out_jsonl)
+    if csv_path:
+        finalize_output(csv_tmp, csv_path)
+    dur = time.monotonic() - start_all
     log.info("Done: %d processed, %d success, %d failed", n, ok_count, n-ok_count)
     log.info("Total cost=$%.4f | Avg per success=$%.4f", total_cost, (total_cost / max(ok_count,1)))
     log.info("Duration: %.2fs", dur)
     log.info("Results with telemetry: %s", out_jsonl)
-    
-    # Create cleaned CSV with only input and output fields
-    df = pd.read_json(out_jsonl, lines=True)
-    input_cols = [c for c in df.columns if c.startswith('input_')]
-    output_cols = [c for c in config.output_model.model_fields.keys() if c in df.columns]
-    cleaned_df = df[input_cols + output_cols]
-    
-    csv_path = out_jsonl.with_suffix('.csv')
-    cleaned_df.to_csv(csv_path, index=False)
-    log.info("Cleaned CSV saved: %s", csv_path)
+    if csv_path:
+        log.info("Cleaned CSV saved: %s", csv_path)
 
 if __name__ == "__main__":
     main()